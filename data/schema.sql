@@ -39,3 +39,34 @@ CREATE TABLE IF NOT EXISTS INVENTARIO_LOCAL (
 -- Índices para búsqueda rápida
 CREATE INDEX IF NOT EXISTS idx_nombre_comercial ON INVENTARIO_LOCAL(nombre_comercial);
 CREATE INDEX IF NOT EXISTS idx_maestro_id ON INVENTARIO_LOCAL(maestro_id);
+CREATE INDEX IF NOT EXISTS idx_nombre_generico ON CATALOGO_MAESTRO(nombre_generico);
+
+-- Índice de texto completo para /search (trigram: búsqueda por subcadena, como LIKE '%q%',
+-- pero sin comodines: '%' y '_' son literales, y las mayúsculas se pliegan también fuera de ASCII)
+-- rowid = INVENTARIO_LOCAL.id; se mantiene sincronizado con triggers
+CREATE VIRTUAL TABLE IF NOT EXISTS inv_fts USING fts5(nombre_comercial, nombre_generico, tokenize='trigram');
+
+CREATE TRIGGER IF NOT EXISTS inv_fts_ai AFTER INSERT ON INVENTARIO_LOCAL BEGIN
+    INSERT INTO inv_fts(rowid, nombre_comercial, nombre_generico)
+    VALUES (new.id, new.nombre_comercial, (SELECT nombre_generico FROM CATALOGO_MAESTRO WHERE id = new.maestro_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS inv_fts_ad AFTER DELETE ON INVENTARIO_LOCAL BEGIN
+    DELETE FROM inv_fts WHERE rowid = old.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS inv_fts_au AFTER UPDATE OF nombre_comercial, maestro_id ON INVENTARIO_LOCAL BEGIN
+    DELETE FROM inv_fts WHERE rowid = old.id;
+    INSERT INTO inv_fts(rowid, nombre_comercial, nombre_generico)
+    VALUES (new.id, new.nombre_comercial, (SELECT nombre_generico FROM CATALOGO_MAESTRO WHERE id = new.maestro_id));
+END;
+
+CREATE TRIGGER IF NOT EXISTS inv_fts_maestro_au AFTER UPDATE OF nombre_generico ON CATALOGO_MAESTRO BEGIN
+    UPDATE inv_fts SET nombre_generico = new.nombre_generico
+    WHERE rowid IN (SELECT id FROM INVENTARIO_LOCAL WHERE maestro_id = new.id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS inv_fts_maestro_ad AFTER DELETE ON CATALOGO_MAESTRO BEGIN
+    UPDATE inv_fts SET nombre_generico = NULL
+    WHERE rowid IN (SELECT id FROM INVENTARIO_LOCAL WHERE maestro_id = old.id);
+END;
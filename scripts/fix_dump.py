@@ -1,30 +1,37 @@
 import re
 
+BUFFER_SIZE = 1 << 20
+
 def process_dump():
     input_file = "timescale_prod.sql"
     output_file = "supabase_ready.sql"
 
     chunk_map = {}
     
-    # Regexes
-    table_create_regex = re.compile(r"CREATE TABLE _timescaledb_internal\.(_hyper_\d+_\d+_chunk)\s*\(")
-    inherits_regex = re.compile(r"INHERITS\s*\((public\.\w+)\)")
+    # Regexes (bytes: the dump is processed in binary mode, no text codec)
+    table_create_regex = re.compile(rb"CREATE TABLE _timescaledb_internal\.(_hyper_\d+_\d+_chunk)\s*\(")
+    inherits_regex = re.compile(rb"INHERITS\s*\((public\.\w+)\)")
+    
+    copy_regex = re.compile(rb"COPY _timescaledb_internal\.(_hyper_\d+_\d+_chunk)\s*\((.*?)\)\s*FROM stdin;")
     
-    copy_regex = re.compile(r"COPY _timescaledb_internal\.(_hyper_\d+_\d+_chunk)\s*\((.*?)\)\s*FROM stdin;")
+    # Cheap prefix checks so plain data rows never reach the regex engine
+    table_create_prefix = b"CREATE TABLE _timescaledb_internal."
+    copy_prefix = b"COPY _timescaledb_internal."
     
     # We also want to skip all lines related to _timescaledb_internal
-    skip_regex = re.compile(r"^(ALTER|CREATE|DROP|COMMENT) .*_timescaledb_internal")
+    # (same as ^(ALTER|CREATE|DROP|COMMENT) .*_timescaledb_internal)
+    skip_prefixes = (b"ALTER ", b"CREATE ", b"DROP ", b"COMMENT ")
     
     print("Mapeando Chunks de Hypertablas a tablas normales...")
     
-    with open(input_file, "r") as fin, open(output_file, "w") as fout:
+    with open(input_file, "rb", buffering=BUFFER_SIZE) as fin, open(output_file, "wb", buffering=BUFFER_SIZE) as fout:
         inside_chunk_create = False
         current_chunk = None
         buffer_chunk = []
         
         for line in fin:
             # Detect chunk creation start
-            m_create = table_create_regex.search(line)
+            m_create = line.startswith(table_create_prefix) and table_create_regex.search(line)
             if m_create:
                 inside_chunk_create = True
                 current_chunk = m_create.group(1)
@@ -37,17 +44,17 @@ def process_dump():
                 if m_inherits:
                     parent_table = m_inherits.group(1)
                     chunk_map[current_chunk] = parent_table
-                    print(f"Mapeado: {current_chunk} -> {parent_table}")
+                    print(f"Mapeado: {current_chunk.decode()} -> {parent_table.decode()}")
                 
                 # End of CREATE TABLE statement
-                if line.strip().endswith(";"):
+                if line.strip().endswith(b";"):
                     inside_chunk_create = False
                     current_chunk = None
                     # We DO NOT write the chunk CREATE TABLE to output, we drop it.
                 continue
             
             # Map COPY statements
-            m_copy = copy_regex.search(line)
+            m_copy = line.startswith(copy_prefix) and copy_regex.search(line)
             if m_copy:
                 chunk_name = m_copy.group(1)
                 cols = m_copy.group(2)
@@ -55,18 +62,18 @@ def process_dump():
                 
                 if parent_table:
                     # Rewrite to target the parent table
-                    new_line = f"COPY {parent_table} ({cols}) FROM stdin;\n"
+                    new_line = b"COPY " + parent_table + b" (" + cols + b") FROM stdin;\n"
                     fout.write(new_line)
                     continue
                 else:
-                    print(f"Advertencia: COPY encontrado para chunk desconocido: {chunk_name}")
+                    print(f"Advertencia: COPY encontrado para chunk desconocido: {chunk_name.decode()}")
             
             # Skip _timescaledb_internal configurations (Indexes, constraints, triggers on chunks)
-            if skip_regex.search(line):
+            if line.startswith(skip_prefixes) and b"_timescaledb_internal" in line:
                 continue
             
             # Skip timescaledb extension creations
-            if "CREATE EXTENSION IF NOT EXISTS timescaledb" in line:
+            if b"CREATE EXTENSION IF NOT EXISTS timescaledb" in line:
                 continue
             
             # Default write line
@@ -1,9 +1,17 @@
 import os
 import re
+import numpy as np
 import psycopg2
+from psycopg2.extras import execute_values
 import pandas as pd
-from difflib import SequenceMatcher
 from dotenv import load_dotenv
+try:
+    from rapidfuzz import fuzz, process
+    FUZZY_AVAILABLE = True
+except ImportError:
+    from difflib import SequenceMatcher
+    FUZZY_AVAILABLE = False
+    print("⚠️  Rapidfuzz no instalado. Usando difflib (más lento).")
 
 # Load environment variables
 load_dotenv()
@@ -12,28 +20,67 @@ load_dotenv()
 DB_URL = os.getenv("DATABASE_URL")
 CSV_PATH = "data/isp_oficial.csv"
 
-# Normalization Function
+# Normalization (regexes compiled once, stop words in a single alternation)
+STOP_WORDS = ['MG', 'COMPRIMIDOS', 'CAPSULAS', 'JARABE', 'CM', 'AL', 'X', 'CAJA', 'FRASCO']
+STOP_RE = re.compile(r'\b(?:' + '|'.join(STOP_WORDS) + r')\b')
+NON_ALNUM_RE = re.compile(r'[^A-Z0-9\s]')
+SPACES_RE = re.compile(r'\s+')
+
 def normalize_text(text):
     if not isinstance(text, str):
         return ""
     
-    # Uppercase
-    text = text.upper()
-    
-    # Remove stop words
-    stop_words = ['MG', 'COMPRIMIDOS', 'CAPSULAS', 'JARABE', 'CM', 'AL', 'X', 'CAJA', 'FRASCO']
-    for word in stop_words:
-        text = re.sub(r'\b' + word + r'\b', '', text)
+    # Uppercase and remove stop words
+    text = STOP_RE.sub('', text.upper())
     
     # Remove special chars and extra spaces
-    text = re.sub(r'[^A-Z0-9\s]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = NON_ALNUM_RE.sub('', text)
+    text = SPACES_RE.sub(' ', text).strip()
     
     return text
 
+def normalize_series(s):
+    """Vectorized normalize_text for a whole column (missing values become '')."""
+    return (s.fillna('').astype(str).str.upper()
+             .str.replace(STOP_RE, '', regex=True)
+             .str.replace(NON_ALNUM_RE, '', regex=True)
+             .str.replace(SPACES_RE, ' ', regex=True)
+             .str.strip())
+
 def similar(a, b):
+    # Normalized to 0..1 like SequenceMatcher.ratio()
+    if FUZZY_AVAILABLE:
+        return fuzz.ratio(a, b) / 100.0
     return SequenceMatcher(None, a, b).ratio()
 
+def pair_similarity(a, b, cutoff=None):
+    """
+    Element-wise similar() of two aligned string columns, as a numpy array.
+    With `cutoff`, rapidfuzz may stop early on pairs that cannot reach it (scored 0).
+    """
+    if FUZZY_AVAILABLE and hasattr(process, 'cpdist'):
+        score_cutoff = None if cutoff is None else cutoff * 100
+        return process.cpdist(a.tolist(), b.tolist(), scorer=fuzz.ratio, workers=-1,
+                              score_cutoff=score_cutoff) / 100.0
+    return np.fromiter((similar(x, y) for x, y in zip(a, b)), dtype=float, count=len(a))
+
+def similar_above(a, b, threshold):
+    """
+    Boolean mask of similar(a, b) > threshold for two aligned columns.
+    Pairs whose lengths alone cap the ratio (2*min/(len_a+len_b)) at or below
+    the threshold are discarded without being scored.
+    """
+    la = a.str.len().to_numpy()
+    lb = b.str.len().to_numpy()
+    total = la + lb
+    bound = np.divide(2 * np.minimum(la, lb), total, out=np.ones(len(a)), where=total > 0)
+
+    hit = np.zeros(len(a), dtype=bool)
+    idx = np.flatnonzero(bound > threshold)
+    if idx.size:
+        hit[idx] = pair_similarity(a.iloc[idx], b.iloc[idx], cutoff=threshold) > threshold
+    return hit
+
 def main():
     if not DB_URL:
         print("❌ Error: DATABASE_URL not found in environment.")
@@ -69,97 +116,88 @@ def main():
 
     # Pre-process ISP data to avoid repeated normalization
     # Unique Active Principles
-    unique_principles = df_isp['Principio Activo'].dropna().unique()
-    normalized_principles = [(p, normalize_text(p)) for p in unique_principles]
-
-    # Map for Bioequivalence check: Principle -> List of (Product Name, Lab, Status)
-    # Filter only relevant columns to speed up
-    bio_map = []
-    for _, row in df_isp.iterrows():
-        p_active = row['Principio Activo']
-        if pd.isna(p_active): continue
-        
-        status = row.get('Estado', '')
-        if 'EQUIVALENTE' in str(status).upper():
-            bio_map.append({
-                'principio': normalize_text(p_active),
-                'producto': normalize_text(str(row['Producto '])), # Note the space in CSV header "Producto "
-                'titular': normalize_text(str(row['Titular'])),
-                'vigencia': str(row.get('Vigencia', '')).upper()
-            })
-
-    # Processing Products
-    for pid, raw_name, raw_lab in products:
-        norm_name = normalize_text(raw_name)
-        norm_lab = normalize_text(raw_lab if raw_lab else "")
-        
-        detected_dci = None
-        is_bioequivalent = False
-
-        # STEP 1: FILL DCI
-        # Check if normalized name contains any normalized principle
-        # Heuristic: Match longest principle first? Or just any?
-        # Let's try to match.
-        for original_p, norm_p in normalized_principles:
-            if len(norm_p) < 3: continue # Skip too short
-            
-            # Strict substring match as requested
-            # "Si el nombre del producto en la DB contiene el string del Principio Activo"
-            if norm_p in norm_name:
-                detected_dci = original_p # Store original formal name
-                break # Found one match
-        
-        # STEP 2: BIOEQUIVALENCE
-        if detected_dci:
-            # Look for matches in bio_map with this principle
-            norm_dci = normalize_text(detected_dci)
-            
-            for entry in bio_map:
-                if entry['principio'] != norm_dci: continue
-                
-                # Check if Lab matches fuzzy OR Product Name matches fuzzy
-                # "verifica si la marca o el laboratorio coinciden parcialmente"
-                
-                lab_score = similar(norm_lab, entry['titular'])
-                name_score = similar(norm_name, entry['producto'])
-                
-                # Threshold for fuzzy match
-                if (lab_score > 0.6 or name_score > 0.6) and 'NO' not in entry['vigencia']:
-                    is_bioequivalent = True
-                    break
-
-        # UPDATE DB
-        if detected_dci or is_bioequivalent:
-            try:
-                # Construct query dynamically based on what we found
-                if detected_dci and is_bioequivalent:
-                    cur.execute("""
-                        UPDATE products 
-                        SET dci = %s, is_bioequivalent = %s 
-                        WHERE id = %s
-                    """, (detected_dci, True, pid))
-                    updates_dci += 1
-                    updates_bio += 1
-                elif detected_dci:
-                    cur.execute("""
-                        UPDATE products 
-                        SET dci = %s 
-                        WHERE id = %s
-                    """, (detected_dci, pid))
-                    updates_dci += 1
-                elif is_bioequivalent:
-                    cur.execute("""
-                        UPDATE products 
-                        SET is_bioequivalent = %s 
-                        WHERE id = %s
-                    """, (True, pid))
-                    updates_bio += 1
-                    
-            except Exception as e:
-                print(f"⚠️ Error updating product {pid}: {e}")
-                conn.rollback()
-
-    conn.commit()
+    unique_principles = pd.Series(df_isp['Principio Activo'].dropna().unique())
+    normalized_principles = list(zip(unique_principles, normalize_series(unique_principles)))
+
+    # Bioequivalence table: Principle -> (Product Name, Lab), only valid equivalents
+    # Filter first, then normalize only the surviving rows column-wise
+    estado = df_isp['Estado'] if 'Estado' in df_isp.columns else pd.Series('', index=df_isp.index)
+    df_bio = df_isp[
+        df_isp['Principio Activo'].notna() &
+        estado.astype(str).str.upper().str.contains('EQUIVALENTE', regex=False, na=False)
+    ]
+    vigencia = df_bio['Vigencia'] if 'Vigencia' in df_bio.columns else pd.Series('', index=df_bio.index)
+    bio_df = pd.DataFrame({
+        'principio': normalize_series(df_bio['Principio Activo']),
+        'producto': normalize_series(df_bio['Producto ']), # Note the space in CSV header "Producto "
+        'titular': normalize_series(df_bio['Titular']),
+        'vigencia': vigencia.fillna('').astype(str).str.upper(),
+    })
+    bio_df = bio_df[~bio_df['vigencia'].str.contains('NO', regex=False)]
+
+    # Processing Products (column-wise)
+    products_df = pd.DataFrame(products, columns=['id', 'name', 'lab'])
+    products_df['norm_name'] = normalize_series(products_df['name'])
+    products_df['norm_lab'] = normalize_series(products_df['lab'])
+    products_df['dci'] = None
+    products_df['norm_dci'] = None
+
+    # STEP 1: FILL DCI
+    # Check if normalized name contains any normalized principle (first principle wins)
+    # Strict substring match as requested
+    # "Si el nombre del producto en la DB contiene el string del Principio Activo"
+    pending = products_df['norm_name']
+    for original_p, norm_p in normalized_principles:
+        if len(norm_p) < 3: continue # Skip too short
+        if pending.empty: break
+
+        hit = pending.str.contains(norm_p, regex=False)
+        if hit.any():
+            products_df.loc[hit[hit].index, ['dci', 'norm_dci']] = [original_p, norm_p] # Store original formal name
+            pending = pending[~hit]
+
+    # STEP 2: BIOEQUIVALENCE
+    # Hash join products x bio entries on the principle, then score every pair at once
+    # Check if Lab matches fuzzy OR Product Name matches fuzzy
+    # "verifica si la marca o el laboratorio coinciden parcialmente"
+    joined = products_df[products_df['dci'].notna()].merge(bio_df, left_on='norm_dci', right_on='principio')
+    # Threshold for fuzzy match: lab first, name only for products no lab matched yet
+    # A missing lab (NULL laboratory / NaN Titular, both '' here) is no evidence: '' vs '' scores 1.0
+    lab_known = ((joined['norm_lab'] != '') & (joined['titular'] != '')).to_numpy()
+    lab_hit = lab_known & similar_above(joined['norm_lab'], joined['titular'], 0.6)
+    bio_ids = set(joined.loc[lab_hit, 'id'])
+    rest = joined[~joined['id'].isin(bio_ids)]
+    name_hit = similar_above(rest['norm_name'], rest['producto'], 0.6)
+    bio_ids.update(rest.loc[name_hit, 'id'])
+
+    # Queue DB updates (flushed in batches below)
+    with_dci = products_df[products_df['dci'].notna()]
+    dci_updates = [(str(pid), dci) for pid, dci in zip(with_dci['id'], with_dci['dci'])]
+    bio_updates = [(str(pid),) for pid in products_df['id'] if pid in bio_ids]
+
+    # UPDATE DB: one VALUES-join statement per page instead of one UPDATE per product
+    # (ids compared as text: products.id is varchar in prod, uuid only in older snapshots)
+    print("💾 Writing updates...")
+    try:
+        execute_values(cur, """
+            UPDATE products AS p
+            SET dci = v.dci
+            FROM (VALUES %s) AS v(id, dci)
+            WHERE p.id::text = v.id
+        """, dci_updates, template="(%s, %s)", page_size=1000)
+        execute_values(cur, """
+            UPDATE products AS p
+            SET is_bioequivalent = TRUE
+            FROM (VALUES %s) AS v(id)
+            WHERE p.id::text = v.id
+        """, bio_updates, template="(%s)", page_size=1000)
+        conn.commit()
+        updates_dci = len(dci_updates)
+        updates_bio = len(bio_updates)
+    except Exception as e:
+        print(f"⚠️ Error updating products: {e}")
+        conn.rollback()
+
     cur.close()
     conn.close()
 
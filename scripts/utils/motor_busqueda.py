@@ -1,6 +1,8 @@
+import functools
 import os
 import sys
 import time
+import numpy as np
 import pandas as pd
 
 # Add src to path
@@ -25,20 +27,42 @@ class FarmaciaVallenarEngine:
         csv_path = os.path.join(base_dir, 'golan.csv')
         
         self.mgr = DataManager(csv_path)
+        # Per-instance LRU keyed on the normalized query (repeated queries are O(1))
+        self._compute = functools.lru_cache(maxsize=256)(self._compute_uncached)
+        self.reload()
+
+    def reload(self):
+        """(Re)loads the inventory and invalidates the query cache."""
         self.df = self.mgr.load_data()
+        self._compute.cache_clear()
         print(f"{GREEN}✓ Sistema cargado: {len(self.df)} productos en memoria.{RESET}")
 
     def buscar(self, query):
         query = query.upper().strip()
         print(f"\nProcesando solicitud: {BOLD}'{query}'{RESET}...")
         
+        result = self._compute(query)
+        if result is None:
+            print(f"❌ No se encontraron productos con el nombre '{query}'.")
+            return
+
+        active_ing, sorted_results = result
+        print(f"➜ Principio Activo Detectado: {BOLD}{active_ing}{RESET}")
+        
+        self._render_results(sorted_results, query)
+
+    def _compute_uncached(self, query):
+        """
+        Pure compute part of the search: filter, rank and sort.
+        Returns (active_ingredient, sorted_results) or None if nothing matches.
+        The returned frame is shared through the cache, treat it as read-only.
+        """
         # 1. Direct Search (What the user asked for)
         # We look for the exact string first, or fuzzy match
-        matches = self.df[self.df['clean_name'].str.contains(query, case=False, na=False)].copy()
+        matches = self.df.iloc[self.mgr.search_clean_name(query)]
         
         if matches.empty:
-            print(f"❌ No se encontraron productos con el nombre '{query}'.")
-            return
+            return None
 
         # 2. Resolve Active Ingredient
         # We assume the user wants the first match's active ingredient
@@ -46,14 +70,11 @@ class FarmaciaVallenarEngine:
         target_product = matches.iloc[0]
         active_ing = target_product['Active_Ingredient']
         
-        print(f"➜ Principio Activo Detectado: {BOLD}{active_ing}{RESET}")
-        
         # 3. Fetch Substitutes (Bioequivalents)
         if active_ing != "DESCONOCIDO":
-            alternatives = self.df[
-                (self.df['Active_Ingredient'] == active_ing) & 
-                (self.df['Stock'] > 0) # Only what we have
-            ].copy()
+            rows = self.mgr.by_ingredient.get(active_ing, np.empty(0, dtype=np.int64))
+            alternatives = self.df.iloc[rows]
+            alternatives = alternatives[alternatives['Stock'].to_numpy() > 0] # Only what we have
         else:
             # Fallback: Just show name matches if we don't know the ingredient
             alternatives = matches
@@ -64,24 +85,22 @@ class FarmaciaVallenarEngine:
         # Priority 3: Requested Product (if not in above)
         # Priority 4: Others
         
-        def calculate_rank(row):
-            # If it matches the user query exactly, it's special (The "Requested" one)
-            is_requested = query in str(row['clean_name'])
-            
-            if row['Is_Generic'] and row['Is_Bioequivalent']:
-                return 1 # Best (Yellow)
-            if row['Is_Bioequivalent']:
-                return 2 # Good (Brand Bioeq)
-            if is_requested:
-                return 3 # What they asked for (if not bioeq)
-            return 4 # Others
-            
-        alternatives['Rank'] = alternatives.apply(calculate_rank, axis=1)
+        # Vectorized: one mask per priority instead of a Python call per row
+        # (clean_name is already uppercased by DrugParser)
+        gen = alternatives['Is_Generic'].to_numpy(dtype=bool)
+        bio = alternatives['Is_Bioequivalent'].to_numpy(dtype=bool)
+        req = alternatives['clean_name'].str.contains(query, regex=False, na=False).to_numpy(dtype=bool)
+        # assign() returns a new frame, so the filtered views are never written to
+        alternatives = alternatives.assign(Rank=np.select(
+            [gen & bio, bio, req],
+            [1, 2, 3], # Best (Yellow), Good (Brand Bioeq), What they asked for
+            default=4  # Others
+        ))
         
         # Sort by Rank (asc), then Price (asc)
         sorted_results = alternatives.sort_values(by=['Rank', 'Precio Venta'])
         
-        self._render_results(sorted_results, query)
+        return active_ing, sorted_results
 
     def _render_results(self, results, original_query):
         print(f"\n{BOLD}{'TIPO':<15} | {'PRODUCTO':<40} | {'PRECIO':<10} | {'PPUM':<10} | {'AHORRO'}{RESET}")
@@ -89,7 +108,7 @@ class FarmaciaVallenarEngine:
         
         # Reference price (Price of the requested product, or the most expensive one in the list to confirm savings)
         # Let's try to find the price of the product that most closely matches the query
-        ref_rows = results[results['clean_name'].str.contains(original_query, na=False)]
+        ref_rows = results[results['clean_name'].str.contains(original_query, regex=False, na=False)]
         ref_price = ref_rows.iloc[0]['Precio Venta'] if not ref_rows.empty else results.iloc[0]['Precio Venta']
         
         for _, row in results.iterrows():
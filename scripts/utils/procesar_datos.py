@@ -1,7 +1,6 @@
 import pandas as pd
 import numpy as np
 import os
-import re
 
 # ==========================================
 # CONFIGURACIÓN
@@ -22,8 +21,14 @@ print(f"--- GENERANDO CATÁLOGO INTEGRAL V3.0 ---")
 # 1. LECTURA Y CORRECCIÓN DE COLUMNAS
 # ==========================================
 print("Leyendo Excel Maestro...")
+# calamine (Rust) es mucho más rápido que openpyxl; se usa si está instalado
+try:
+    import python_calamine  # noqa: F401
+    motor_excel = 'calamine'
+except ImportError:
+    motor_excel = 'openpyxl'
 # Leemos con header=1 porque la fila 1 tiene los títulos reales
-df_inv = pd.read_excel(archivo_inventario, header=1, engine='openpyxl')
+df_inv = pd.read_excel(archivo_inventario, header=1, engine=motor_excel)
 # Limpiamos espacios en los nombres de las columnas
 df_inv.columns = [str(c).strip() for c in df_inv.columns]
 
@@ -63,13 +68,10 @@ df_clean['Stock'] = df_inv[col_stock].fillna(0) if col_stock else 0
 df_clean['Costo'] = df_inv[col_costo].fillna(0) if col_costo else 0
 df_clean['Precio'] = df_inv[col_precio].fillna(0) if col_precio else 0
 
-# Limpieza Numérica
-def limpiar_num(val):
-    s = re.sub(r'[^\d\-]', '', str(val))
-    return int(float(s)) if s else 0
-
+# Limpieza Numérica (vectorizada: deja solo dígitos y signo, vacío/inválido -> 0)
 for col in ['Stock', 'Costo', 'Precio']:
-    df_clean[col] = df_clean[col].apply(limpiar_num)
+    solo_digitos = df_clean[col].astype(str).str.replace(r'[^\d\-]', '', regex=True)
+    df_clean[col] = pd.to_numeric(solo_digitos, errors='coerce').fillna(0).astype(np.int64)
 
 # FILTRO CLAVE: Solo eliminamos si no hay nombre de producto
 df_clean = df_clean[df_clean['Producto'] != "SIN NOMBRE"]
@@ -83,34 +85,35 @@ mapa_cat = {}
 if os.path.exists(archivo_cenabast):
     try:
         df_cen = pd.read_csv(archivo_cenabast, on_bad_lines='skip')
-        for _, row in df_cen.iterrows():
-            nom = str(row.get('Nombre producto genérico','')).upper()
-            cat = str(row.get('Clasificación interna','')).strip()
-            if len(nom) > 3 and cat not in ['nan','']:
-                key = nom.split()[0] # Primera palabra clave
-                if key not in mapa_cat: mapa_cat[key] = cat
+        # Vectorizado: una pasada por columna en vez de iterrows
+        nom = df_cen['Nombre producto genérico'].fillna('').astype(str).str.upper()
+        cat = df_cen['Clasificación interna'].fillna('').astype(str).str.strip()
+        key = nom.str.split().str[0] # Primera palabra clave
+        mask = (nom.str.len() > 3) & ~cat.isin(['nan','']) & key.notna()
+        key, cat = key[mask], cat[mask]
+        primero = ~key.duplicated() # Gana la primera aparición
+        mapa_cat = dict(zip(key[primero], cat[primero]))
     except: pass
 
-def get_cat(txt):
-    if not isinstance(txt, str): return "OTROS"
-    tokens = txt.upper().split()
-    for t in tokens:
-        if len(t) > 3 and t in mapa_cat: return mapa_cat[t]
-    return "SIN CLASIFICAR"
-
-df_clean['Categoria'] = df_clean['Producto'].apply(get_cat)
+# Vectorizado: primer token (> 3 letras) presente en el mapa, por producto
+nombres = df_clean['Producto'].str.upper() # NaN si no es texto
+tokens = nombres.str.split().explode()
+tokens = tokens[tokens.str.len() > 3]
+hits = tokens.map(mapa_cat).dropna()
+df_clean['Categoria'] = hits.groupby(level=0).first().reindex(df_clean.index, fill_value="SIN CLASIFICAR")
+df_clean.loc[nombres.isna(), 'Categoria'] = "OTROS"
 
 # ==========================================
 # 3. ESTADOS DE NEGOCIO (ESTRATEGIA VALLENAR)
 # ==========================================
-def definir_estado(row):
-    s = row['Stock']
-    p = row['Precio']
-    if s > 0 and p > 0: return "DISPONIBLE"       # Verde: Vender ya
-    if s <= 0 and p > 0: return "POR ENCARGO"     # Amarillo: Pedir
-    return "SOLO REFERENCIA"                      # Gris: Info
-
-df_clean['Estado'] = df_clean.apply(definir_estado, axis=1)
+s = df_clean['Stock'].to_numpy()
+p = df_clean['Precio'].to_numpy()
+df_clean['Estado'] = np.select(
+    [(s > 0) & (p > 0),      # Verde: Vender ya
+     (s <= 0) & (p > 0)],    # Amarillo: Pedir
+    ["DISPONIBLE", "POR ENCARGO"],
+    default="SOLO REFERENCIA" # Gris: Info
+)
 
 # Ordenar: Primero lo Disponible
 df_clean.sort_values(by=['Estado', 'Producto'], ascending=[True, True], inplace=True)
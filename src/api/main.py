@@ -2,6 +2,8 @@ from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 import sqlite3
 import os
+import threading
+from contextlib import contextmanager
 from typing import List, Optional
 from pydantic import BaseModel
 
@@ -18,11 +20,43 @@ app.add_middleware(
 
 DB_PATH = os.path.join(os.path.dirname(__file__), '../../data/farmacia.db')
 
-def get_db_connection():
+# One cached connection per worker thread: setup and page cache survive across requests.
+# pipeline.init_db deletes and recreates the file, so each connection remembers which
+# file it opened and is replaced once the file on disk changes.
+_local = threading.local()
+
+def _db_signature():
+    try:
+        st = os.stat(DB_PATH)
+    except OSError:
+        return None # Being rebuilt by the ETL
+    return (st.st_dev, st.st_ino, st.st_mtime_ns)
+
+def _connect():
+    # journal_mode=WAL is persistent in the file (set by pipeline.init_db), not per connection
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA cache_size=-65536")    # 64 MB page cache
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MB
     return conn
 
+@contextmanager
+def get_db_cursor():
+    signature = _db_signature()
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and signature is not None and signature != _local.signature:
+        conn.close()
+        conn = None
+    if conn is None:
+        conn = _local.conn = _connect()
+        _local.signature = signature
+    cursor = conn.cursor()
+    try:
+        yield cursor
+    finally:
+        cursor.close()
+
 # Models
 class Product(BaseModel):
     id: int
@@ -45,57 +79,49 @@ def health_check():
 
 @app.get("/search", response_model=SearchResponse)
 def search_products(q: str = Query(..., min_length=2)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    q_str = f"%{q.upper()}%"
+    if len(q) >= 3:
+        # Trigram FTS index: substring match without the full scan. Unlike LIKE, '%' and '_'
+        # are literal and case folding also covers non-ASCII letters (Ñ/ñ, É/é)
+        source = "inv_fts f JOIN INVENTARIO_LOCAL i ON i.id = f.rowid"
+        where = "inv_fts MATCH ?"
+        params = ('"' + q.upper().replace('"', '""') + '"',)
+    else:
+        # Trigrams need at least 3 chars: short queries keep the LIKE scan,
+        # with '%' / '_' escaped so they are literal here too
+        q_str = "%" + q.upper().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        source = "INVENTARIO_LOCAL i"
+        where = "i.nombre_comercial LIKE ? ESCAPE '\\' OR m.nombre_generico LIKE ? ESCAPE '\\'"
+        params = (q_str, q_str)
     
     # 1. Search in Local Inventory
-    cursor.execute("""
-        SELECT 
-            i.id, i.nombre_comercial, i.precio, i.stock, i.maestro_id,
-            m.nombre_generico, m.es_bioequivalente
-        FROM INVENTARIO_LOCAL i
-        LEFT JOIN CATALOGO_MAESTRO m ON i.maestro_id = m.id
-        WHERE i.nombre_comercial LIKE ? OR m.nombre_generico LIKE ?
-        ORDER BY i.stock DESC, i.precio ASC
-        LIMIT 20
-    """, (q_str, q_str))
+    with get_db_cursor() as cursor:
+        cursor.execute(f"""
+            SELECT 
+                i.id, i.nombre_comercial AS nombre, i.precio, i.stock,
+                CASE
+                    WHEN i.stock > 0 THEN 'AVAILABLE'
+                    WHEN i.precio > 0 THEN 'ORDER'
+                    ELSE 'REF'
+                END AS status,
+                -- In our schema, we assume if it has a maestro_id, it participates in the bioequivalence program
+                i.maestro_id IS NOT NULL AS is_bioequivalent,
+                -- Heuristic for Generic: If name matches generic name roughly
+                (COALESCE(m.nombre_generico, '') != '' AND instr(i.nombre_comercial, m.nombre_generico) > 0) AS is_generic,
+                i.maestro_id
+            FROM {source}
+            LEFT JOIN CATALOGO_MAESTRO m ON i.maestro_id = m.id
+            WHERE {where}
+            ORDER BY i.stock DESC, i.precio ASC
+            LIMIT 20
+        """, params)
     
-    rows = cursor.fetchall()
-    results = []
+        rows = cursor.fetchall()
     
     # Logic to determine "Bioequivalent Alternatives"
     # If a result is a BRAND and has a maestro_id, we should fetch its GENERIC siblings
-    
-    for row in rows:
-        status = "REF"
-        if row['stock'] > 0:
-            status = "AVAILABLE"
-        elif row['precio'] > 0:
-            status = "ORDER"
-            
-        # Check bioequivalence flag from Maestro
-        # In our schema, we assume if it has a maestro_id, it participates in the bioequivalence program
-        is_bio = row['maestro_id'] is not None
-        
-        # Heuristic for Generic: If name matches generic name roughly
-        is_gen = False
-        if row['nombre_generico'] and row['nombre_generico'] in row['nombre_comercial']:
-            is_gen = True
-
-        results.append({
-            "id": row['id'],
-            "nombre": row['nombre_comercial'],
-            "precio": row['precio'],
-            "stock": row['stock'],
-            "status": status,
-            "is_bioequivalent": is_bio,
-            "is_generic": is_gen,
-            "maestro_id": row['maestro_id']
-        })
+    # All derived columns come from SQL, rows map 1:1 to Product
+    results = [dict(row) for row in rows]
         
-    conn.close()
     return {"query": q, "results": results}
 
 @app.get("/product/{product_id}/alternatives")
@@ -103,42 +129,32 @@ def get_alternatives(product_id: int):
     """
     Get bioequivalent alternatives for a specific product ID.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Get the product's maestro_id
-    cursor.execute("SELECT maestro_id, precio FROM INVENTARIO_LOCAL WHERE id = ?", (product_id,))
-    prod = cursor.fetchone()
+    with get_db_cursor() as cursor:
+        # Get the product's maestro_id
+        cursor.execute("SELECT maestro_id, precio FROM INVENTARIO_LOCAL WHERE id = ?", (product_id,))
+        prod = cursor.fetchone()
     
-    if not prod or not prod['maestro_id']:
-        return {"alternatives": []}
+        if not prod or not prod['maestro_id']:
+            return {"alternatives": []}
         
-    maestro_id = prod['maestro_id']
-    base_price = prod['precio']
+        maestro_id = prod['maestro_id']
+        base_price = prod['precio']
     
-    # Search siblings
-    cursor.execute("""
-        SELECT 
-            i.id, i.nombre_comercial, i.precio, i.stock,
-            m.nombre_generico
-        FROM INVENTARIO_LOCAL i
-        JOIN CATALOGO_MAESTRO m ON i.maestro_id = m.id
-        WHERE i.maestro_id = ? AND i.id != ? AND i.stock > 0
-        ORDER BY i.precio ASC
-    """, (maestro_id, product_id))
+        # Search siblings
+        cursor.execute("""
+            SELECT 
+                i.id, i.nombre_comercial AS nombre, i.precio, i.stock,
+                MAX(0, ? - i.precio) AS savings,
+                instr(i.nombre_comercial, m.nombre_generico) > 0 AS is_generic
+            FROM INVENTARIO_LOCAL i
+            JOIN CATALOGO_MAESTRO m ON i.maestro_id = m.id
+            WHERE i.maestro_id = ? AND i.id != ? AND i.stock > 0
+            ORDER BY i.precio ASC
+        """, (base_price, maestro_id, product_id))
     
-    rows = cursor.fetchall()
-    alts = []
-    for row in rows:
-        savings = max(0, base_price - row['precio'])
-        alts.append({
-            "id": row['id'],
-            "nombre": row['nombre_comercial'],
-            "precio": row['precio'],
-            "stock": row['stock'],
-            "savings": savings,
-            "is_generic": row['nombre_generico'] in row['nombre_comercial']
-        })
+        rows = cursor.fetchall()
+    # No response_model here: turn SQLite's 0/1 back into a JSON bool
+    alts = [{**dict(row), "is_generic": bool(row['is_generic'])} for row in rows]
         
     return {"alternatives": alts}
 
@@ -1,7 +1,11 @@
 import pandas as pd
+import numpy as np
 import sqlite3
 import os
 import sys
+import itertools
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 try:
     from rapidfuzz import process, fuzz
     FUZZY_AVAILABLE = True
@@ -10,10 +14,18 @@ except ImportError:
     FUZZY_AVAILABLE = False
     print("⚠️  Rapidfuzz no instalado. Usando difflib (más lento).")
 
+# calamine (Rust) es mucho más rápido que openpyxl; se usa si está instalado
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = 'openpyxl'
+
 # Add project root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.modules.drug_parser import DrugParser
+from src.modules.drug_parser import DrugParser, PARALLEL_MIN_ROWS, PARSE_WORKERS
+from src.modules.parquet_cache import pq, source_key, cache_is_fresh, write_cache
 
 # CONFIG
 DB_PATH = os.path.join(os.path.dirname(__file__), '../../data/farmacia.db')
@@ -23,20 +35,143 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), '../../data')
 GOLAN_FILE = os.path.join(DATA_DIR, 'inventario golan.xlsx')
 CENABAST_FILE = os.path.join(DATA_DIR, 'Maestro Materiales Cenabast Octubre 2025 - Listado Productos.csv')
 
+FUZZY_THRESHOLD = 85
+FUZZY_BATCH = 1000 # Query rows per cdist call (bounds the score matrix size)
+INVENTARIO_CHUNK = 5000 # Inventory rows parsed, linked and inserted per step
+
 def init_db():
     print("Inicializando Base de Datos...")
-    if os.path.exists(DB_PATH):
-        os.remove(DB_PATH) # Fresh start for the migration
+    for path in (DB_PATH, DB_PATH + '-wal', DB_PATH + '-shm'):
+        if os.path.exists(path):
+            os.remove(path) # Fresh start for the migration (incl. stale WAL files)
         
-    conn = sqlite3.connect(DB_PATH)
+    # Autocommit mode: the migration runs inside one explicit transaction (see __main__)
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536") # 64 MB page cache
     with open(SCHEMA_PATH, 'r') as f:
         conn.executescript(f.read())
     
     # Init Sucursal
     conn.execute("INSERT INTO SUCURSALES (nombre, direccion) VALUES ('Casa Matriz', 'Vallenar Centro')")
-    conn.commit()
     return conn
 
+def maestro_token_index(maestro_keys):
+    """
+    Token -> key positions (np.int64, in key order) and each key's token count,
+    for perfect_token_matches. Built once per load, shared by every chunk.
+    """
+    postings = defaultdict(list)
+    key_sizes = np.zeros(len(maestro_keys), dtype=np.int64)
+    for k, key in enumerate(maestro_keys):
+        tokens = set(key.split())
+        key_sizes[k] = len(tokens)
+        for token in tokens:
+            postings[token].append(k)
+    postings = {token: np.array(keys, dtype=np.int64) for token, keys in postings.items()}
+    return postings, key_sizes
+
+def perfect_token_matches(names, maestro_keys, key_index):
+    """
+    For each name, the first maestro key whose token set contains, or is contained
+    in, the name's token set, else None. Those pairs score token_set_ratio == 100,
+    so the key is exactly what the cdist argmax would return for the name.
+    `key_index` is maestro_token_index(maestro_keys).
+    """
+    postings, key_sizes = key_index
+
+    matches = []
+    for name in names:
+        tokens = set(name.split())
+        known = [postings[token] for token in tokens if token in postings]
+        if not known:
+            matches.append(None)
+            continue
+        # Shared tokens per candidate key (np.unique keeps key order: first hit = first key)
+        hits, shared = np.unique(np.concatenate(known), return_counts=True)
+        full = (shared == key_sizes[hits]) | (shared == len(tokens))
+        matches.append(maestro_keys[hits[full][0]] if full.any() else None)
+    return matches
+
+def fuzzy_link(names, maestro_keys, key_index=None):
+    """
+    Best maestro key for each name (token_set_ratio > FUZZY_THRESHOLD) or None.
+    With rapidfuzz the whole score matrix is computed natively by `cdist`, in batches;
+    score_cutoff lets it skip pairs that cannot reach the threshold. Names and keys
+    are already uppercase and normalized, so no per-call processor is applied.
+    Pass `key_index` (maestro_token_index) when linking repeatedly against the same keys.
+    """
+    # Identical names (several SKUs of one product) are scored once, then scattered back
+    codes, unique_names = pd.factorize(pd.Series(names, dtype=object))
+    unique_names = unique_names.tolist()
+    
+    if FUZZY_AVAILABLE:
+        # Perfect token matches settle most rows without scoring; only the rest go to cdist
+        if key_index is None:
+            key_index = maestro_token_index(maestro_keys)
+        best = perfect_token_matches(unique_names, maestro_keys, key_index)
+        residual = [k for k, key in enumerate(best) if key is None]
+        for start in range(0, len(residual), FUZZY_BATCH):
+            rows = residual[start:start + FUZZY_BATCH]
+            batch = [unique_names[k] for k in rows]
+            scores = process.cdist(batch, maestro_keys, scorer=fuzz.token_set_ratio, processor=None,
+                                   score_cutoff=FUZZY_THRESHOLD, workers=-1)
+            top_idx = scores.argmax(axis=1)
+            top_score = scores[np.arange(len(batch)), top_idx]
+            for k, key_idx, score in zip(rows, top_idx, top_score):
+                if score > FUZZY_THRESHOLD:
+                    best[k] = maestro_keys[key_idx]
+    else:
+        # Fallback: difflib.get_close_matches
+        # It returns a list of matches, we take top 1
+        best = [next(iter(difflib.get_close_matches(name, maestro_keys, n=1, cutoff=0.8)), None)
+                for name in unique_names]
+    
+    return [best[code] for code in codes]
+
+def to_int_column(df, col):
+    """Integer values of a column (missing / unparseable values -> 0)."""
+    if not col:
+        return np.zeros(len(df), dtype=np.int64)
+    return pd.to_numeric(df[col], errors='coerce').fillna(0).astype(np.int64).to_numpy()
+
+def column_rows(df, columns):
+    """
+    Row tuples for executemany, zipped lazily from per-column lists (Python scalars,
+    no per-row Series / namedtuple and no materialized list of rows).
+    """
+    return zip(*(df[col].tolist() for col in columns))
+
+# The Parquet copy holds the raw read_excel output: keyed on this file (read options) and the engine
+GOLAN_CACHE_KEY = f"{source_key(__file__)}:{EXCEL_ENGINE}"
+
+def golan_cache(path):
+    """Path of the Parquet copy of the Golan Excel, and whether it can be reused."""
+    cache_path = os.path.splitext(path)[0] + '.parquet'
+    return cache_path, cache_is_fresh(cache_path, path, GOLAN_CACHE_KEY)
+
+def read_golan_excel(path):
+    """
+    Reads the Golan XLSX (header on the second row), reusing a Parquet copy
+    of it while it is fresh (see golan_cache).
+    """
+    cache_path, fresh = golan_cache(path)
+    if fresh:
+        print("Usando caché Parquet del inventario...")
+        return pd.read_parquet(cache_path)
+
+    df = pd.read_excel(path, header=1, engine=EXCEL_ENGINE)
+    write_cache(df, cache_path, GOLAN_CACHE_KEY)
+    return df
+
+# Columns loaded into the inventory staging table
+STAGE_COLUMNS = ['sku', 'nombre_comercial', 'precio', 'stock', 'clean_name']
+
+# CENABAST columns -> (cenabast_id, nombre_generico, clasificacion)
+MAESTRO_COLUMNS = ['Código material', 'Nombre producto genérico', 'Clasificación interna']
+
 def load_maestro(conn):
     print("Cargando Maestro CENABAST...")
     if not os.path.exists(CENABAST_FILE):
@@ -44,52 +179,115 @@ def load_maestro(conn):
         return
 
     try:
-        df = pd.read_csv(CENABAST_FILE, on_bad_lines='skip')
         # Mapping columns based on typical Cenabast file structure
         # Adjust these names based on actual file headers if needed
-        # We assume headers like: 'Nombre producto genérico', 'Código', 'Clasificación'
-        
-        # Prepare data for insertion
-        records = []
-        unique_names = set()
+        # Only the three columns we insert are parsed (missing ones are filled with '')
+        df = pd.read_csv(CENABAST_FILE, on_bad_lines='skip', dtype='string',
+                         usecols=lambda c: c in MAESTRO_COLUMNS)
+        for col in MAESTRO_COLUMNS:
+            df[col] = df[col].fillna('').str.strip() if col in df else ''
         
-        for _, row in df.iterrows():
-            nombre = str(row.get('Nombre producto genérico', '')).strip().upper()
-            codigo = str(row.get('Código material', '')).strip()
-            clasificacion = str(row.get('Clasificación interna', '')).strip()
-            
-            if nombre and nombre not in unique_names:
-                records.append((codigo, nombre, clasificacion))
-                unique_names.add(nombre)
+        # Prepare data for insertion (first occurrence of each generic name)
+        df['Nombre producto genérico'] = df['Nombre producto genérico'].str.upper()
+        df = df[df['Nombre producto genérico'] != ''].drop_duplicates('Nombre producto genérico')
+        records = column_rows(df, MAESTRO_COLUMNS)
         
         conn.executemany(
             "INSERT OR IGNORE INTO CATALOGO_MAESTRO (cenabast_id, nombre_generico, clasificacion) VALUES (?, ?, ?)",
             records
         )
-        conn.commit()
-        print(f"✓ {len(records)} productos maestros cargados.")
+        print(f"✓ {len(df)} productos maestros cargados.")
         
     except Exception as e:
         print(f"❌ Error cargando maestro: {e}")
 
+def iter_golan_chunks(path, size=INVENTARIO_CHUNK):
+    """
+    Yields the Golan inventory as DataFrames of at most `size` rows. With a fresh
+    Parquet cache only one record batch is decoded at a time; otherwise the Excel
+    is read once (writing the cache) and sliced.
+    """
+    cache_path, fresh = golan_cache(path)
+    if fresh:
+        print("Usando caché Parquet del inventario...")
+        for batch in pq.ParquetFile(cache_path).iter_batches(batch_size=size):
+            yield batch.to_pandas()
+        return
+
+    df = read_golan_excel(path)
+    for start in range(0, len(df), size):
+        yield df.iloc[start:start + size]
+
+def fetch_maestro(conn):
+    """
+    Maestro name -> id map and its keys, in id (insertion) order. The order matters:
+    fuzzy ties (e.g. a bare DCI scoring 100 against every presentation) go to the
+    first key, and idx_nombre_generico would otherwise return them alphabetically.
+    """
+    cursor = conn.execute("SELECT id, nombre_generico FROM CATALOGO_MAESTRO ORDER BY id")
+    maestro_cache = {row[1]: row[0] for row in cursor.fetchall()}
+    return maestro_cache, list(maestro_cache.keys())
+
+def link_stage(conn, maestro_cache, maestro_keys, fuzzy_memo, key_index=None):
+    """
+    Fills inv_stage.maestro_id: exact names through the nombre_generico index,
+    the rest with fuzzy_link (results memoized across chunks in `fuzzy_memo`,
+    `key_index` is the load's maestro_token_index).
+    """
+    # A. Exact Match - one join against the nombre_generico index
+    conn.execute("""
+        UPDATE inv_stage SET maestro_id = (
+            SELECT MAX(m.id) FROM CATALOGO_MAESTRO m WHERE m.nombre_generico = inv_stage.clean_name
+        )""")
+    
+    # B. Fuzzy Match (if needed) - Only if we have keys, one batched pass over the unlinked rows
+    pending = conn.execute("SELECT id, clean_name FROM inv_stage WHERE maestro_id IS NULL").fetchall()
+    if not pending or not maestro_keys:
+        return
+    
+    new_names = list(dict.fromkeys(name for _, name in pending if name not in fuzzy_memo))
+    fuzzy_memo.update(zip(new_names, fuzzy_link(new_names, maestro_keys, key_index)))
+    conn.executemany(
+        "UPDATE inv_stage SET maestro_id = ? WHERE id = ?",
+        [(maestro_cache[fuzzy_memo[name]], stage_id) for stage_id, name in pending if fuzzy_memo[name] is not None]
+    )
+
+def inventory_records(df, col_prod, col_code, col_price, col_stock):
+    """
+    Golan rows -> STAGE_COLUMNS minus clean_name, with column-wise coercions done once
+    instead of per row. Rows without a product name (str() == 'nan') are skipped,
+    as the original row loop did: nombre_comercial is NOT NULL and there is nothing to link.
+    """
+    records_df = pd.DataFrame({
+        'sku': np.where(df[col_code].notna(), df[col_code].map(str), None) if col_code else None,
+        'nombre_comercial': df[col_prod].map(str).to_numpy(),
+        'precio': to_int_column(df, col_price),
+        'stock': to_int_column(df, col_stock),
+    })
+    return records_df[records_df['nombre_comercial'] != 'nan'].reset_index(drop=True)
+
 def load_inventario(conn):
     print("Cargando Inventario Local (Golan)...")
     if not os.path.exists(GOLAN_FILE):
         print(f"❌ Error: No se encontró {GOLAN_FILE}")
         return
 
-    # Load with pandas
+    # Load with pandas, chunk by chunk (peak memory ~ one chunk of parsed rows)
     # Skip header row if needed, similar to what we saw in procesar_datos.py
-    df = pd.read_excel(GOLAN_FILE, header=1, engine='openpyxl')
+    chunks = iter_golan_chunks(GOLAN_FILE)
+    df = next(chunks, None)
+    if df is None:
+        print("❌ Inventario vacío")
+        return
     
     # Normalize columns
-    df.columns = [str(c).strip() for c in df.columns]
+    columns = [str(c).strip() for c in df.columns]
     
     # Find columns dynamically
-    col_prod = next((c for c in df.columns if 'Producto' in c), None)
-    col_stock = next((c for c in df.columns if 'Stock' in c), None)
-    col_price = next((c for c in df.columns if 'Precio' in c), None)
-    col_code = next((c for c in df.columns if 'Código' in c or 'Barra' in c), None)
+    col_prod = next((c for c in columns if 'Producto' in c), None)
+    col_stock = next((c for c in columns if 'Stock' in c), None)
+    col_price = next((c for c in columns if 'Precio' in c), None)
+    col_code = next((c for c in columns if 'Código' in c or 'Barra' in c), None)
     
     if not col_prod:
         print("❌ No se encontró columna de Producto")
@@ -97,68 +295,68 @@ def load_inventario(conn):
 
     # Pre-fetch Maestro for Linker
     print("Indexando Maestro para vinculación inteligente...")
-    cursor = conn.execute("SELECT id, nombre_generico FROM CATALOGO_MAESTRO")
-    maestro_cache = {row[1]: row[0] for row in cursor.fetchall()}
-    maestro_keys = list(maestro_cache.keys())
+    maestro_cache, maestro_keys = fetch_maestro(conn)
+    key_index = maestro_token_index(maestro_keys) if FUZZY_AVAILABLE and maestro_keys else None
+    fuzzy_memo = {}
     
-    records_to_insert = []
+    # Staging table for one chunk of parsed rows, linking is done inside SQLite
+    conn.execute("DROP TABLE IF EXISTS temp.inv_stage")
+    conn.execute("""
+        CREATE TEMP TABLE inv_stage (
+            id INTEGER PRIMARY KEY, sku TEXT, nombre_comercial TEXT,
+            precio INTEGER, stock INTEGER, clean_name TEXT, maestro_id INTEGER
+        )""")
     
-    print(f"Procesando {len(df)} registros de inventario...")
-    
-    for i, row in df.iterrows():
-        raw_name = str(row[col_prod])
-        if raw_name == 'nan': continue
-        
-        # 1. Parse Data
-        parsed = DrugParser.parse(raw_name)
-        clean_name = parsed['clean_name']
+    # One parse pool for the whole load, started once the input is known to be large:
+    # each chunk is below PARALLEL_MIN_ROWS, so parse_series alone would never start one
+    parse_pool = None
+    rows_read = total = skipped = 0
+    try:
+        for df in itertools.chain([df], chunks):
+            df.columns = columns
+            print(f"Procesando {len(df)} registros de inventario...")
+            rows_read += len(df)
+            if parse_pool is None and PARSE_WORKERS > 1 and rows_read >= PARALLEL_MIN_ROWS:
+                parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
         
-        # 2. Extract Numbers
-        try:
-            stock = int(row[col_stock]) if pd.notna(row[col_stock]) else 0
-        except: stock = 0
-            
-        try:
-            precio = int(row[col_price]) if pd.notna(row[col_price]) else 0
-        except: precio = 0
+            records_df = inventory_records(df, col_prod, col_code, col_price, col_stock)
+            skipped += len(df) - len(records_df)
         
-        sku = str(row[col_code]) if col_code and pd.notna(row[col_code]) else None
+            # 1. Parse Data
+            records_df['clean_name'] = DrugParser.parse_series(records_df['nombre_comercial'], parse_pool)['clean_name']
 
-        # 3. SMART LINKING (The "Bioequivalence" Link)
-        maestro_id = None
-        
-        # A. Exact Match
-        if clean_name in maestro_cache:
-            maestro_id = maestro_cache[clean_name]
-        
-        # B. Fuzzy Match (if needed) - Only if we have keys
-        elif maestro_keys:
-             if FUZZY_AVAILABLE:
-                 match = process.extractOne(clean_name, maestro_keys, scorer=fuzz.token_set_ratio)
-                 if match and match[1] > 85:
-                     maestro_id = maestro_cache[match[0]]
-             else:
-                 # Fallback: difflib.get_close_matches
-                 # It returns a list of matches, we take top 1
-                 matches = difflib.get_close_matches(clean_name, maestro_keys, n=1, cutoff=0.8)
-                 if matches:
-                     maestro_id = maestro_cache[matches[0]]
-        
-        records_to_insert.append((sku, raw_name, precio, stock, maestro_id))
-        
-        if i % 500 == 0:
-            print(f"   ...procesados {i}")
+            # 2. Stage the parsed rows
+            conn.execute("DELETE FROM inv_stage")
+            conn.executemany(
+                "INSERT INTO inv_stage (sku, nombre_comercial, precio, stock, clean_name) VALUES (?, ?, ?, ?, ?)",
+                column_rows(records_df, STAGE_COLUMNS)
+            )
 
-    conn.executemany(
-        "INSERT INTO INVENTARIO_LOCAL (sku, nombre_comercial, precio, stock, maestro_id) VALUES (?, ?, ?, ?, ?)",
-        records_to_insert
-    )
-    conn.commit()
-    print(f"✓ {len(records_to_insert)} productos locales insertados.")
+            # 3. SMART LINKING (The "Bioequivalence" Link)
+            link_stage(conn, maestro_cache, maestro_keys, fuzzy_memo, key_index)
+        
+            conn.execute("""
+                INSERT INTO INVENTARIO_LOCAL (sku, nombre_comercial, precio, stock, maestro_id)
+                SELECT sku, nombre_comercial, precio, stock, maestro_id FROM inv_stage ORDER BY id
+            """)
+            total += len(records_df)
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown()
+    
+    conn.execute("DROP TABLE inv_stage")
+    print(f"✓ {total} productos locales insertados.")
+    if skipped:
+        print(f"   ({skipped} filas sin nombre de producto omitidas)")
 
 if __name__ == "__main__":
     connection = init_db()
+    connection.execute("BEGIN IMMEDIATE")
     load_maestro(connection)
+    # Stats for the planner: the exact-link UPDATE goes through idx_nombre_generico
+    connection.execute("ANALYZE")
     load_inventario(connection)
+    connection.execute("COMMIT")
+    connection.execute("PRAGMA optimize")
     connection.close()
     print("\n✅ MIGRACIÓN COMPLETADA. Base de datos lista en data/farmacia.db")
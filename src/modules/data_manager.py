@@ -1,11 +1,15 @@
 import pandas as pd
+import numpy as np
 import os
 import sys
+import inspect
+from collections import defaultdict
 
 # Add project root to path if needed for direct execution
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from src.modules.drug_parser import DrugParser
+from src.modules.parquet_cache import PYARROW_AVAILABLE, source_key, cache_is_fresh, write_cache
 
 try:
     from rapidfuzz import process, fuzz
@@ -15,6 +19,17 @@ except ImportError:
     FUZZY_AVAILABLE = False
     print("Warning: rapidfuzz not found, using difflib (slower).")
 
+try:
+    import ahocorasick  # pyahocorasick: multi-pattern scan for the non-fuzzy fallback
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+STRING_DTYPE = 'string[pyarrow]' if PYARROW_AVAILABLE else 'string'
+
+# Below this many rows a clean_name scan beats the token index for 1-2 token queries
+TOKEN_INDEX_MIN_ROWS = 100_000
+
 class DataManager:
     """
     Central Data Hub for the Pharmaceutical Module.
@@ -24,7 +39,11 @@ class DataManager:
     def __init__(self, data_path):
         self.data_path = data_path
         self.inventory_df = None
+        self.token_index = {}
+        self.by_ingredient = {}
+        self._token_vocab = pd.Series([], dtype=STRING_DTYPE)
         self.isp_db_mock = self._load_mock_isp_db()
+        self._isp_automaton = self._build_isp_automaton()
         
     def _load_mock_isp_db(self):
         """
@@ -65,11 +84,57 @@ class DataManager:
             }
         }
 
+    def _build_isp_automaton(self):
+        """
+        Aho-Corasick automaton over every ISP key and brand. Each word maps to
+        (kind, rank, key): keys before brands, then catalogue order, so the smallest
+        hit is the one the nested substring loops would have found first.
+        """
+        if not AHOCORASICK_AVAILABLE:
+            return None
+        
+        priorities = {}
+        for rank, key in enumerate(self.isp_db_mock):
+            priorities.setdefault(key, (0, rank, key))
+        for rank, (key, data) in enumerate(self.isp_db_mock.items()):
+            for brand in data.get('brands', []):
+                priorities.setdefault(brand, (1, rank, key))
+        
+        automaton = ahocorasick.Automaton()
+        for word, priority in priorities.items():
+            automaton.add_word(word, priority)
+        automaton.make_automaton()
+        return automaton
+
     def load_data(self):
-        """Loads and parses the raw golan.csv"""
+        """Loads and parses the raw golan.csv (reusing a Parquet cache of the result when fresh)"""
         if not os.path.exists(self.data_path):
             raise FileNotFoundError(f"File not found: {self.data_path}")
             
+        cache_path = os.path.splitext(self.data_path)[0] + '.parquet'
+        # Keyed on the parser and enrichment code (ISP mock included), not just the CSV mtime
+        cache_key = source_key(inspect.getfile(DrugParser), __file__)
+        if cache_is_fresh(cache_path, self.data_path, cache_key):
+            # Columnar cache keeps dtypes (category/bool), no re-parsing needed
+            print("Loading processed inventory from cache...")
+            self.inventory_df = pd.read_parquet(cache_path)
+        else:
+            self.inventory_df = self._process_raw()
+            write_cache(self.inventory_df, cache_path, cache_key)
+
+        # Inverted index for name search
+        self._build_token_index()
+
+        # Reverse index for sibling lookup: ingredient -> row positions
+        self.by_ingredient = {
+            key: np.asarray(rows, dtype=np.int64)
+            for key, rows in self.inventory_df.groupby('Active_Ingredient', observed=True).indices.items()
+        }
+
+        return self.inventory_df
+
+    def _process_raw(self):
+        """Parses the raw CSV and enriches it with regulatory data."""
         # Initialize loading
         print("Loading raw inventory...")
         # Using ; separator as seen in view_file of golan.csv
@@ -81,38 +146,115 @@ class DataManager:
         
         # Apply Parsing
         print("Structuring unstructured data...")
-        self.inventory_df = DrugParser.process_dataframe(df, col_name='Producto')
+        df_final = DrugParser.process_dataframe(df, col_name='Producto')
         
         # Determine Bioequivalence
         print("Linking with Regulatory Data (Simulated)...")
-        self.inventory_df = self.inventory_df.apply(self._enrich_compliance, axis=1)
-        
-        return self.inventory_df
+        self._enrich_compliance(df_final)
+
+        # Compact dtypes: low-cardinality ingredient as category codes, flags as real bools,
+        # canonical uppercase names so searches can match case-sensitively
+        df_final['clean_name'] = df_final['clean_name'].astype(STRING_DTYPE).str.upper()
+        df_final['Active_Ingredient'] = df_final['Active_Ingredient'].astype('category')
+        flag_cols = ['Is_Generic', 'Is_Bioequivalent']
+        df_final[flag_cols] = df_final[flag_cols].astype(bool)
+
+        return df_final
 
-    def _enrich_compliance(self, row):
+    def _build_token_index(self):
         """
-        Adds regulatory flags: Is_Bioequivalent, Active_Ingredient, is_Generic
+        Builds token -> sorted row positions (np.int32) over clean_name.
         """
-        clean_name = str(row.get('clean_name', '')).upper()
-        # Fallback to search if clean_name is empty
-        if not clean_name: clean_name = str(row.get('Producto', '')).upper()
-        
-        found_active_ingredient = "DESCONOCIDO"
-        is_bioequivalent = False
-        is_generic = False # Default
+        postings = defaultdict(list)
+        for pos, name in enumerate(self.inventory_df['clean_name']):
+            for token in set(str(name).split()):
+                postings[token].append(pos)
+
+        self.token_index = {token: np.array(rows, dtype=np.int32) for token, rows in postings.items()}
+        self._token_vocab = pd.Series(list(self.token_index.keys()), dtype=STRING_DTYPE)
+
+    def search_clean_name(self, query):
+        """
+        Returns the row positions whose clean_name contains `query` (same result as
+        a full `str.contains` scan, in row order). Inner query tokens must be whole
+        words, so their postings narrow the candidates; edge tokens may be part of a
+        longer word and need a vocabulary scan, only worth it on large catalogues.
+        """
+        tokens = query.split()
+        names = self.inventory_df['clean_name']
+        inner = tokens[1:-1]
+        if inner:
+            candidates = None
+            for token in inner:
+                rows = self.token_index.get(token, np.empty(0, dtype=np.int32))
+                candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+                if candidates.size == 0:
+                    return candidates
+        elif tokens and len(names) >= TOKEN_INDEX_MIN_ROWS and len(self._token_vocab) < len(names):
+            candidates = None
+            for token in tokens:
+                # Edge tokens may be part of a longer word: union over the vocabulary
+                hits = self._token_vocab[self._token_vocab.str.contains(token, regex=False)]
+                rows = np.unique(np.concatenate([self.token_index[t] for t in hits] or [np.empty(0, dtype=np.int32)]))
+                candidates = rows if candidates is None else np.intersect1d(candidates, rows, assume_unique=True)
+                if candidates.size == 0:
+                    return candidates
+        else:
+            # Small catalogue (or no tokens): the direct scan is cheaper than the index
+            return np.flatnonzero(names.str.contains(query, regex=False, na=False).to_numpy(dtype=bool)).astype(np.int32)
+
+        # Verify the exact substring on the (small) candidate set
+        return candidates[names.iloc[candidates].str.contains(query, regex=False, na=False).to_numpy(dtype=bool)]
+
+    @staticmethod
+    def _compliance_names(df):
+        """Uppercase names used for regulatory matching (Producto where clean_name is empty)."""
+        def upper(col):
+            if col not in df: return pd.Series('', index=df.index, dtype=object)
+            return df[col].map(lambda v: str(v).upper())
         
-        # 1. Try to find the active ingredient in our Mock DB
-        # This is a naive heuristic (substring matching) for the demo
-        best_match = None
+        names = upper('clean_name')
+        # Fallback to search if clean_name is empty
+        return names.where(names != '', upper('Producto'))
+
+    def _match_isp_keys(self, names):
+        """
+        Resolves the ISP mock key for every name at once (None when there is no match).
+        Each distinct name is matched once and the result scattered back to its rows.
+        """
+        codes, unique_names = pd.factorize(pd.Series(names, dtype=object))
+        matches = self._match_unique_isp_keys(unique_names.tolist())
+        return [matches[code] for code in codes]
+
+    def _match_unique_isp_keys(self, names):
+        """
+        ISP key (or None) per name. With rapidfuzz, a single `cdist` computes the
+        full name x key score matrix natively.
+        """
+        keys = list(self.isp_db_mock.keys())
         
         # We search against the keys of our mock DB (which are usually "INGREDIENT DOSE")
         if FUZZY_AVAILABLE:
-            match_tuple = process.extractOne(clean_name, list(self.isp_db_mock.keys()), scorer=fuzz.token_set_ratio)
-            if match_tuple and match_tuple[1] > 85: # Threshold
-                best_match = match_tuple[0]
-        else:
+            if not names:
+                return []
+            scores = process.cdist(names, keys, scorer=fuzz.token_set_ratio, score_cutoff=85, workers=-1)
+            top_idx = scores.argmax(axis=1)
+            top_score = scores[np.arange(len(names)), top_idx]
+            return [keys[k] if score > 85 else None for k, score in zip(top_idx, top_score)] # Threshold
+        
+        if self._isp_automaton is not None:
+            # One linear scan per name finds every key and brand occurrence at once
+            matches = []
+            for clean_name in names:
+                hits = [priority for _, priority in self._isp_automaton.iter(clean_name)]
+                matches.append(min(hits)[2] if hits else None)
+            return matches
+        
+        matches = []
+        for clean_name in names:
+            best_match = None
             # Fallback 1: Check keys
-            for key in self.isp_db_mock.keys():
+            for key in keys:
                 if key in clean_name:
                     best_match = key
                     break
@@ -125,50 +267,67 @@ class DataManager:
                             best_match = key
                             break
                     if best_match: break
+            matches.append(best_match)
+        return matches
+
+    def _enrich_compliance(self, df):
+        """
+        Adds regulatory columns in place: Active_Ingredient, Is_Bioequivalent, Is_Generic
+        and Calculated_PPUM. Column-wise masks per ISP key, no per-row apply.
+        """
+        names = self._compliance_names(df)
+        
+        # 1. Find the active ingredient key (one batched match for the whole frame)
+        isp_keys = pd.Series(self._match_isp_keys(names.tolist()), index=df.index, dtype=object)
+        
+        active_ingredient = np.full(len(df), "DESCONOCIDO", dtype=object)
+        is_bioequivalent = np.zeros(len(df), dtype=bool)
+        is_generic = np.zeros(len(df), dtype=bool) # Default
         
-        if best_match:
-            data = self.isp_db_mock[best_match]
-            found_active_ingredient = data['active_ingredient']
+        for key, data in self.isp_db_mock.items():
+            rows = (isp_keys == key).to_numpy()
+            if not rows.any(): continue
+            ingredient = data['active_ingredient']
+            matched = names[rows]
+            active_ingredient[rows] = ingredient
             
             # 2. Check if it IS a generic (matches the active ingredient name strongly)
-            if found_active_ingredient in clean_name and "COMPUESTO" not in clean_name:
-                 # Check if it's purely descriptive (e.g. "PARACETAMOL 500MG") vs Brand ("KITADOL")
-                 # Heuristic: If the cleaned name is very similar to the active ingredient, it's generic
-                 ratio = 0
-                 if FUZZY_AVAILABLE:
-                     ratio = fuzz.ratio(clean_name.replace("MG","").strip(), found_active_ingredient)
-                 else:
-                     ratio = 100 if clean_name.startswith(found_active_ingredient) else 0
-                 
-                 if ratio > 60: 
-                     is_generic = True
-                     is_bioequivalent = True # Core assumption: Generics in DB are bioequivalent
+            # Heuristic: If the cleaned name is very similar to the active ingredient, it's generic
+            generic = (matched.str.contains(ingredient, regex=False)
+                       & ~matched.str.contains("COMPUESTO", regex=False)).to_numpy(dtype=bool, copy=True)
+            if FUZZY_AVAILABLE:
+                ratio = np.array([fuzz.ratio(n.replace("MG","").strip(), ingredient, score_cutoff=60)
+                                  for n in matched[generic]])
+            else:
+                ratio = np.where(matched[generic].str.startswith(ingredient), 100, 0)
+            generic[generic] = ratio > 60 # Core assumption: Generics in DB are bioequivalent
             
-            # 3. Check matching brands
+            # 3. Check matching brands (Brands in DB are bioequivalent, and not generic)
+            branded = np.zeros(len(matched), dtype=bool)
             for brand in data['brands']:
-                if brand in clean_name:
-                    is_bioequivalent = True # Brands in DB are bioequivalent
-                    is_generic = False
-
-        row['Active_Ingredient'] = found_active_ingredient
-        row['Is_Bioequivalent'] = is_bioequivalent
-        row['Is_Generic'] = is_generic
-        row['Calculated_PPUM'] = self._calculate_ppum(row)
+                branded |= matched.str.contains(brand, regex=False).to_numpy()
+            
+            is_bioequivalent[rows] = generic | branded
+            is_generic[rows] = generic & ~branded
+
+        df['Active_Ingredient'] = active_ingredient
+        df['Is_Bioequivalent'] = is_bioequivalent
+        df['Is_Generic'] = is_generic
+        df['Calculated_PPUM'] = self._calculate_ppum(df)
         
-        return row
+        return df
 
-    def _calculate_ppum(self, row):
+    @staticmethod
+    def _calculate_ppum(df):
         """
-        Calculates Price Per Unit of Measure (required by law).
+        Calculates Price Per Unit of Measure (required by law), for the whole frame.
         """
-        try:
-            price = float(str(row['Precio Venta']).replace(',','.'))
-            qty = float(row['qty_val'])
-            if qty > 0:
-                return round(price / qty, 2)
-        except (ValueError, TypeError):
-            pass
-        return 0
+        raw_price = df['Precio Venta']
+        price = pd.to_numeric(raw_price.astype(str).str.replace(',', '.', regex=False), errors='coerce')
+        qty = pd.to_numeric(df['qty_val'], errors='coerce')
+        ppum = (price / qty).round(2).where(qty > 0, 0)
+        # Unparseable prices give 0 (a missing price stays NaN)
+        return ppum.where(price.notna() | raw_price.isna(), 0).astype(float)
 
 if __name__ == "__main__":
     # Test run
@@ -1,15 +1,64 @@
+import os
 import re
+import functools
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 
 # Constants for Regex
+# The parser uppercases its input first, so the patterns are case-sensitive
+# (IGNORECASE roughly doubles the matching cost). [Iİ] keeps the one extra
+# match IGNORECASE had on uppercased text: 'İ' (U+0130) stays as is after upper().
 # Matches: 500 MG, 500MG, 0.5 %, 1000 UI, 5 GRS
-REGEX_DOSIS = re.compile(r'(\d+(?:[.,]\d+)?)\s*(MG|G|GR|MCG|ML|%|UI|GRS)', re.IGNORECASE)
+REGEX_DOSIS = re.compile(r'(\d+(?:[.,]\d+)?)\s*(MG|G|GR|MCG|ML|%|U[Iİ]|GRS)')
 
 # Matches: X20 COMP, ENV 30, 20 COMP, 100 ML (Quantity)
-REGEX_CANTIDAD = re.compile(r'(?:X\s*|ENV\s*|^|\s)(\d+)\s*(COMP|CAP|SOBRE|ML|AMPOLLA|FRASCO|UNID|UND|DOSIS|G)', re.IGNORECASE)
+REGEX_CANTIDAD = re.compile(r'(?:X\s*|ENV\s*|^|\s)(\d+)\s*(COMP|CAP|SOBRE|ML|AMPOLLA|FRASCO|UN[Iİ]D|UND|DOS[Iİ]S|G)')
 
 # Matches: LAB. CHILE, LABORATORIO MINTLAB, LAB SOPHIA
-REGEX_LAB = re.compile(r'(?:LAB\.|LABORATORIO|LAB)\s+(.*)$', re.IGNORECASE)
+REGEX_LAB = re.compile(r'(?:LAB\.|LABORATOR[Iİ]O|LAB)\s+(.*)$')
+
+# Cleanup: loose "X20" leftovers
+REGEX_X_SUELTO = re.compile(r'\bX\d+\b')
+
+# Dose, quantity and "X20" patterns all need a digit: names without one skip those passes
+REGEX_DIGITO = re.compile(r'\d')
+
+# Output columns of the parser (same order as the dict returned by `parse`)
+PARSED_COLUMNS = ['original', 'lab', 'dose_val', 'dose_unit', 'qty_val', 'qty_unit', 'clean_name']
+
+# Low-cardinality parsed fields, stored as pandas categories by process_dataframe
+CATEGORY_COLUMNS = ['lab', 'dose_unit', 'qty_unit']
+
+# Columns with at least this many rows are parsed in worker processes;
+# below it, starting the pool costs more than the parsing itself
+PARALLEL_MIN_ROWS = 50_000
+PARSE_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+
+def _remove_token(text, token, fill):
+    """
+    text.replace(token, fill), except for occurrences that are the tail of a longer
+    number: '5G' stays inside 'X15G', '25MCG' inside '125MCG', '5MG' inside '2,5MG'.
+    """
+    if not token[:1].isdecimal():
+        return text.replace(token, fill)
+    parts = []
+    start = 0
+    i = text.find(token)
+    while i != -1:
+        prev = text[i - 1] if i else ''
+        if prev.isdecimal() or (prev in ',.' and i > 1 and text[i - 2].isdecimal()):
+            i = text.find(token, i + 1)
+            continue
+        parts.append(text[start:i])
+        parts.append(fill)
+        start = i + len(token)
+        i = text.find(token, start)
+    parts.append(text[start:])
+    return ''.join(parts)
+
+def _parse_chunk(texts):
+    """Worker entry point for DrugParser._parse_parallel (module level so it pickles)."""
+    return [DrugParser._parse_text(text) for text in texts]
 
 class DrugParser:
     """
@@ -33,51 +82,99 @@ class DrugParser:
                 'qty_unit': None
             }
             
+        return dict(zip(PARSED_COLUMNS, DrugParser._parse_text(product_name)))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=200_000)
+    def _parse_text(product_name: str) -> tuple:
+        """
+        Core of `parse` for string input, returns the fields in PARSED_COLUMNS order.
+        Memoized: repeated product names (several SKUs, re-runs) skip the regex work;
+        the result is an immutable tuple, callers build their own dict / rows from it.
+        """
         text_bruto = product_name.upper().strip()
-        resultado = {
-            'original': text_bruto,
-            'lab': 'NO IDENTIFICADO',
-            'dose_val': None,
-            'dose_unit': None,
-            'qty_val': None,
-            'qty_unit': None,
-            'clean_name': text_bruto,
-        }
+        original = text_bruto
+        lab = 'NO IDENTIFICADO'
+        dose_val = dose_unit = qty_val = qty_unit = None
         
         # 1. Extract Lab (Usually at the end)
-        match_lab = REGEX_LAB.search(text_bruto)
+        match_lab = REGEX_LAB.search(text_bruto) if 'LAB' in text_bruto else None
         if match_lab:
-            resultado['lab'] = match_lab.group(1).strip()
+            lab = match_lab.group(1).strip()
             # Remove from string to verify later
             text_bruto = text_bruto.replace(match_lab.group(0), '')
             
-        # 2. Extract Dose
-        # We might have multiple doses (Bioequivalent compound), we take the first one or all?
-        # For simple parsing, let's take the first match as the primary dose.
-        match_dosis = REGEX_DOSIS.search(text_bruto)
-        if match_dosis:
-            resultado['dose_val'] = match_dosis.group(1)
-            resultado['dose_unit'] = match_dosis.group(2)
-            # Remove from string, replace with space
-            text_bruto = text_bruto.replace(match_dosis.group(0), ' ') 
-
-        # 3. Extract Quantity / Format
-        match_cant = REGEX_CANTIDAD.search(text_bruto)
-        if match_cant:
-            resultado['qty_val'] = match_cant.group(1)
-            resultado['qty_unit'] = match_cant.group(2)
-            text_bruto = text_bruto.replace(match_cant.group(0), ' ')
+        has_digits = REGEX_DIGITO.search(text_bruto) is not None
+        if has_digits:
+            # 2. Extract Dose
+            # We might have multiple doses (Bioequivalent compound), we take the first one or all?
+            # For simple parsing, let's take the first match as the primary dose.
+            match_dosis = REGEX_DOSIS.search(text_bruto)
+            if match_dosis:
+                dose_val, dose_unit = match_dosis.group(1), match_dosis.group(2)
+                # Remove from string, replace with space (every copy, not the digits of a longer number)
+                text_bruto = _remove_token(text_bruto, match_dosis.group(0), ' ')
+
+            # 3. Extract Quantity / Format
+            match_cant = REGEX_CANTIDAD.search(text_bruto)
+            if match_cant:
+                qty_val, qty_unit = match_cant.group(1), match_cant.group(2)
+                text_bruto = _remove_token(text_bruto, match_cant.group(0), ' ')
             
         # 4. Clean up remaining text to find the "Name" or "Brand"
         # Remove extra spaces, special chars like "3-A" if it looks like a prefix code
-        text_bruto = re.sub(r'\s+', ' ', text_bruto).strip()
+        text_bruto = ' '.join(text_bruto.split())
         
         # Heuristic: Remove typical artifacts or "X" if left over
-        text_bruto = re.sub(r'\bX\d+\b', '', text_bruto) # remove things like X20 if missed
+        if has_digits:
+            text_bruto = REGEX_X_SUELTO.sub('', text_bruto) # remove things like X20 if missed
         
-        resultado['clean_name'] = text_bruto.strip()
+        return (original, lab, dose_val, dose_unit, qty_val, qty_unit, text_bruto.strip())
+
+    @staticmethod
+    def parse_series(s: pd.Series, executor=None) -> pd.DataFrame:
+        """
+        Parses a whole column into a DataFrame with PARSED_COLUMNS, aligned to `s.index`.
+        Builds the columns straight from tuples (no per-row dict / Series).
+        With `executor` (a pool kept alive across calls, e.g. per ETL chunk) the
+        column is always parsed on it; otherwise large columns get their own pool.
+        """
+        values = s.tolist()
+        parse_text = DrugParser._parse_text
+        if executor is not None or (len(values) >= PARALLEL_MIN_ROWS and PARSE_WORKERS > 1):
+            parse_text = DrugParser._parse_parallel([v for v in values if isinstance(v, str)], executor).__getitem__
+        
+        rows = [
+            parse_text(v) if isinstance(v, str)
+            else (str(v), 'NO IDENTIFICADO', None, None, None, None, str(v))
+            for v in values
+        ]
+        return pd.DataFrame.from_records(rows, columns=PARSED_COLUMNS, index=s.index)
+
+    @staticmethod
+    def _parse_parallel(texts: list, executor=None) -> dict:
+        """
+        Parses the distinct strings of `texts` across CPU cores -> {text: fields},
+        on `executor` if given, else on a pool started for this call.
+        Falls back to the current process if the pool cannot be used.
+        """
+        unique = list(dict.fromkeys(texts))
+        size = max(1, -(-len(unique) // (PARSE_WORKERS * 4))) # a few chunks per worker
+        chunks = [unique[i:i + size] for i in range(0, len(unique), size)]
+        try:
+            if executor is not None:
+                results = list(executor.map(_parse_chunk, chunks))
+            else:
+                with ProcessPoolExecutor(max_workers=PARSE_WORKERS) as executor:
+                    results = list(executor.map(_parse_chunk, chunks))
+        except Exception as e:
+            print(f"Warning: parallel parsing unavailable ({e}), parsing in-process.")
+            results = [_parse_chunk(chunk) for chunk in chunks]
         
-        return resultado
+        parsed = {}
+        for chunk, fields in zip(chunks, results):
+            parsed.update(zip(chunk, fields))
+        return parsed
 
     @staticmethod
     def process_dataframe(df: pd.DataFrame, col_name: str = 'Producto') -> pd.DataFrame:
@@ -85,12 +182,12 @@ class DrugParser:
         Applies parsing to a whole dataframe column and returns a new dataframe with expanded columns.
         """
         print(f"Parsing {len(df)} records...")
-        parsed_data = df[col_name].apply(DrugParser.parse)
+        df_parsed = DrugParser.parse_series(df[col_name])
         
-        # Convert list of dicts to DataFrame
-        df_parsed = pd.json_normalize(parsed_data)
+        # Labs and units repeat a lot: integer codes + one copy of each value
+        for col in CATEGORY_COLUMNS:
+            df_parsed[col] = df_parsed[col].astype('category')
         
-        # Merge back
-        # We assume the index matches
-        df_final = pd.concat([df.reset_index(drop=True), df_parsed], axis=1)
+        # Merge back (parse_series keeps df's index)
+        df_final = pd.concat([df, df_parsed], axis=1).reset_index(drop=True)
         return df_final
@@ -0,0 +1,53 @@
+import hashlib
+import os
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pyarrow = pq = None
+    PYARROW_AVAILABLE = False
+
+# Parquet schema metadata field holding the key of the code that wrote the cache
+CACHE_KEY_FIELD = b'farmacias_cache_key'
+
+def source_key(*paths):
+    """
+    Hash of the given source files. Used as cache key so a change to the code that
+    produced a cache (parser, enrichment, read options) invalidates it.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def cache_is_fresh(cache_path, source_path, key):
+    """True if cache_path exists, is not older than source_path and was written with `key`."""
+    if not (PYARROW_AVAILABLE and os.path.exists(cache_path)):
+        return False
+    if os.path.getmtime(cache_path) < os.path.getmtime(source_path):
+        return False
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+    except Exception:
+        return False # Unreadable / partial file: rebuild it
+    return metadata.get(CACHE_KEY_FIELD) == key.encode()
+
+def write_cache(df, cache_path, key):
+    """
+    Writes df (without index) as zstd Parquet, tagging the schema with `key`.
+    Best effort: a no-op without pyarrow, and a failed write only warns (both return False).
+    """
+    if not PYARROW_AVAILABLE:
+        return False
+    try:
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[CACHE_KEY_FIELD] = key.encode()
+        pq.write_table(table.replace_schema_metadata(metadata), cache_path, compression='zstd')
+    except Exception as e:
+        print(f"⚠️  Warning: could not write cache {cache_path}: {e}")
+        return False
+    return True
@@ -0,0 +1,55 @@
+import sys
+import os
+import unittest
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.modules import data_manager
+from src.modules.data_manager import DataManager
+
+class TestSearchCleanName(unittest.TestCase):
+
+    def setUp(self):
+        self.mgr = DataManager('unused.csv')
+        self.mgr.inventory_df = pd.DataFrame({'clean_name': [
+            'PARACETAMOL',
+            'KITADOL PARACETAMOL FORTE',
+            'ACIDO ACETILSALICILICO',
+            'ACIDO ACETILSALICILICO CARDIO',
+            'IBUPROFENO',
+            'PARACETAMOL',
+            'IBUPROFENO',
+            'ACIDO ACETILSALICILICO',
+        ]})
+        self.mgr._build_token_index()
+        # Fewer distinct tokens than rows, so the index path is taken when allowed
+        self.assertLess(len(self.mgr._token_vocab), len(self.mgr.inventory_df))
+
+    def check(self, query, expected):
+        # Same rows whether the scan or the token index answers
+        for min_rows in (10**9, 0):
+            with mock.patch.object(data_manager, 'TOKEN_INDEX_MIN_ROWS', min_rows):
+                self.assertEqual(self.mgr.search_clean_name(query).tolist(), expected, (query, min_rows))
+
+    def test_edge_token_part_of_word(self):
+        self.check('CETAMOL', [0, 1, 5])
+        self.check('DOL PARA', [1])
+        self.check('ACIDO ACETIL', [2, 3, 7])
+
+    def test_inner_token_whole_word(self):
+        self.check('KITADOL PARACETAMOL FORTE', [1])
+        self.check('ACIDO ACETILSALICILICO CAR', [3])
+        # Inner token only as part of a word: no match
+        self.check('DOL PARACETAM FORTE', [])
+
+    def test_empty_or_whitespace_query(self):
+        self.check('', list(range(8)))
+        self.check('   ', [])
+        self.check('NOPE', [])
+
+if __name__ == '__main__':
+    unittest.main()
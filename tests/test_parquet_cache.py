@@ -0,0 +1,47 @@
+import sys
+import os
+import tempfile
+import unittest
+import pandas as pd
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.modules.parquet_cache import PYARROW_AVAILABLE, cache_is_fresh, write_cache
+
+@unittest.skipUnless(PYARROW_AVAILABLE, "pyarrow not installed")
+class TestParquetCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, 'golan.csv')
+        self.cache = os.path.join(self.tmp.name, 'golan.parquet')
+        with open(self.source, 'w') as f:
+            f.write('Producto\nPARACETAMOL 500 MG\n')
+        self.df = pd.DataFrame({'clean_name': ['PARACETAMOL'], 'lab': pd.Categorical(['CHILE'])})
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_roundtrip_with_same_key(self):
+        write_cache(self.df, self.cache, 'v1')
+        self.assertTrue(cache_is_fresh(self.cache, self.source, 'v1'))
+        pd.testing.assert_frame_equal(pd.read_parquet(self.cache), self.df)
+
+    def test_stale_on_code_change(self):
+        write_cache(self.df, self.cache, 'v1')
+        self.assertFalse(cache_is_fresh(self.cache, self.source, 'v2'))
+
+    def test_stale_on_newer_source(self):
+        write_cache(self.df, self.cache, 'v1')
+        mtime = os.path.getmtime(self.cache)
+        os.utime(self.source, (mtime + 10, mtime + 10))
+        self.assertFalse(cache_is_fresh(self.cache, self.source, 'v1'))
+
+    def test_missing_or_untagged_cache(self):
+        self.assertFalse(cache_is_fresh(self.cache, self.source, 'v1'))
+        self.df.to_parquet(self.cache, index=False) # Written before caches were keyed
+        self.assertFalse(cache_is_fresh(self.cache, self.source, 'v1'))
+
+if __name__ == '__main__':
+    unittest.main()
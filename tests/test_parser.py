@@ -1,11 +1,13 @@
 import sys
 import os
 import unittest
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
 
 # Add project root to path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.modules.drug_parser import DrugParser
+from src.modules.drug_parser import DrugParser, PARSED_COLUMNS
 
 class TestDrugParser(unittest.TestCase):
     
@@ -52,5 +54,94 @@ class TestDrugParser(unittest.TestCase):
         self.assertEqual(res['qty_val'], "200")
         self.assertEqual(res['qty_unit'], "DOSIS")
 
+    def test_number_tail_not_removed(self):
+        # "5G" must not be cut out of "X15G" as well
+        res = DrugParser.parse("BENZAC AC PEROXIDO DE BENZOILO 5G X15G LAB. GALDERMA")
+        self.assertEqual(res['dose_val'], "5")
+        self.assertEqual(res['qty_val'], "15")
+        self.assertEqual(res['qty_unit'], "G")
+        # "25MCG" must not be cut out of "125MCG"
+        res = DrugParser.parse("FLUSACORT SALMETEROL + FLUTICASONA PROPIONATO 25MCG + 125MCG 120DOSIS LAB. HETERO")
+        self.assertEqual(res['clean_name'], "FLUSACORT SALMETEROL + FLUTICASONA PROPIONATO + 125MCG")
+        self.assertEqual(res['qty_val'], "120")
+
+    def test_repeated_tokens_removed(self):
+        # Every copy of the dose goes, so the quantity is not read from a leftover one
+        res = DrugParser.parse("ACECNOU 3G FOSFOMICINA TROMETAMOL 3GRS 1 UND SOBRE LAB. FAES FARMA")
+        self.assertEqual(res['qty_val'], "1")
+        self.assertEqual(res['qty_unit'], "UND")
+        res = DrugParser.parse("C-REBRUM AVENA + ALFALFA + LECITINA 48ML + 48ML + 107MG X60CAPS LAB.AURA VITALIS")
+        self.assertEqual(res['dose_val'], "48")
+        self.assertEqual(res['qty_val'], "60")
+        self.assertEqual(res['qty_unit'], "CAP")
+        self.assertNotIn("X60", res['clean_name'])
+        res = DrugParser.parse("ARIZOL 10MG ARIPIPRAZOL 10MG 28 COMPRIMIDOS")
+        self.assertNotIn("10MG", res['clean_name'])
+        res = DrugParser.parse("ADORLAN 2525 DICLOFENACO SODICO +TRAMADOL CLORHIDRATO 25MG + 25MG X10 COMP. GRUNENTHAL")
+        self.assertNotIn("25MG", res['clean_name'])
+        self.assertIn("2525", res['clean_name'])
+
+    def test_parse_series_matches_parse(self):
+        raws = [
+            "ACICLOVIR 200 MG X25 COMP LAB CHILE.",
+            "AARTFENACIN FEXOFENADINA CLORHIDRATO 180MG 30 COMP. LAB PHARMARIS",
+            "ADORLAN DICLOFENACO SODICO +TRAMADOL 25MG + 25MG X10 COMP. GRUNENTHAL",
+            "AEROLIN SALBUTAMOL 100MCG 200DOSIS LAB. GSK",
+        ]
+        df = DrugParser.parse_series(pd.Series(raws, index=[10, 20, 30, 40]))
+        self.assertEqual(list(df.index), [10, 20, 30, 40])
+        for idx, raw in zip(df.index, raws):
+            expected = DrugParser.parse(raw)
+            got = df.loc[idx].to_dict()
+            for key in got:
+                self.assertEqual(got[key], expected[key], f"{raw!r} -> {key}")
+
+    def test_parse_series_non_text(self):
+        df = DrugParser.parse_series(pd.Series([None, 123], dtype=object))
+        self.assertEqual(df.loc[1, 'clean_name'], "123")
+        self.assertEqual(df.loc[0, 'lab'], "NO IDENTIFICADO")
+        self.assertIsNone(df.loc[1, 'dose_val'])
+
+    def test_process_dataframe_categories(self):
+        df = pd.DataFrame({'Producto': [
+            "ACICLOVIR 200 MG X25 COMP LAB CHILE.",
+            "AEROLIN SALBUTAMOL 100MCG 200DOSIS LAB. GSK",
+            "ACICLOVIR 400 MG X25 COMP LAB CHILE.",
+        ]})
+        res = DrugParser.process_dataframe(df)
+        for col in ('lab', 'dose_unit', 'qty_unit'):
+            self.assertEqual(res[col].dtype, 'category')
+        self.assertEqual(res['lab'].tolist(), ["CHILE.", "GSK", "CHILE."])
+        self.assertEqual(list(res['qty_unit'].cat.categories), ["COMP", "DOSIS"])
+
+    def test_parse_parallel_matches_parse(self):
+        raws = [
+            "ACICLOVIR 200 MG X25 COMP LAB CHILE.",
+            "AEROLIN SALBUTAMOL 100MCG 200DOSIS LAB. GSK",
+            "ACICLOVIR 200 MG X25 COMP LAB CHILE.",
+        ]
+        parsed = DrugParser._parse_parallel(raws)
+        self.assertEqual(len(parsed), 2)
+        for raw in raws:
+            self.assertEqual(dict(zip(PARSED_COLUMNS, parsed[raw])), DrugParser.parse(raw))
+
+    def test_parse_series_shared_executor(self):
+        # One pool reused across calls, as load_inventario does per chunk
+        chunks = [
+            pd.Series(["ACICLOVIR 200 MG X25 COMP LAB CHILE.", None]),
+            pd.Series(["AEROLIN SALBUTAMOL 100MCG 200DOSIS LAB. GSK"], index=[7]),
+        ]
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            for s in chunks:
+                self.assertTrue(DrugParser.parse_series(s, executor).equals(DrugParser.parse_series(s)))
+
+    def test_parse_cached_results_not_shared(self):
+        raw = "ACICLOVIR 200 MG X25 COMP LAB CHILE."
+        first = DrugParser.parse(raw)
+        first['clean_name'] = "MODIFICADO"
+        second = DrugParser.parse(raw)
+        self.assertEqual(second['clean_name'], "ACICLOVIR")
+        self.assertIsNot(first, second)
+
 if __name__ == '__main__':
     unittest.main()
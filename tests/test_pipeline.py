@@ -0,0 +1,57 @@
+import sys
+import os
+import sqlite3
+import unittest
+import numpy as np
+import pandas as pd
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.etl.pipeline import SCHEMA_PATH, fetch_maestro, fuzzy_link, inventory_records
+
+class TestMaestroLinking(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        with open(SCHEMA_PATH, 'r') as f:
+            self.conn.executescript(f.read())
+        # Inserted in non-alphabetical order
+        self.names = ['ACICLOVIR 200MG/5ML SUS', 'ACICLOVIR 200 MG CM/CP', 'CALCITRIOL 0,5 MCG', 'CALCITRIOL 0,25 MCG']
+        self.conn.executemany(
+            "INSERT INTO CATALOGO_MAESTRO (cenabast_id, nombre_generico) VALUES (?, ?)",
+            [(str(i), name) for i, name in enumerate(self.names)]
+        )
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_fetch_maestro_id_order(self):
+        maestro_cache, maestro_keys = fetch_maestro(self.conn)
+        self.assertEqual(maestro_keys, self.names)
+        self.assertEqual([maestro_cache[k] for k in maestro_keys], [1, 2, 3, 4])
+
+    def test_fuzzy_tie_goes_to_first_inserted(self):
+        # A bare DCI scores 100 against every presentation: the lowest id wins
+        _, maestro_keys = fetch_maestro(self.conn)
+        self.assertEqual(fuzzy_link(['ACICLOVIR', 'CALCITRIOL'], maestro_keys),
+                         ['ACICLOVIR 200MG/5ML SUS', 'CALCITRIOL 0,5 MCG'])
+
+class TestInventoryRecords(unittest.TestCase):
+
+    def test_rows_without_name_skipped(self):
+        df = pd.DataFrame({
+            'Producto': ['PARACETAMOL 500 MG', np.nan, 'KITADOL 500'],
+            'Código Barras': [780001, 780002, np.nan],
+            'Precio Venta': ['1000', '2000', 'N/A'],
+            'Stock': [3, np.nan, 1],
+        })
+        records = inventory_records(df, 'Producto', 'Código Barras', 'Precio Venta', 'Stock')
+        self.assertEqual(records['nombre_comercial'].tolist(), ['PARACETAMOL 500 MG', 'KITADOL 500'])
+        self.assertEqual(records['sku'][0], '780001.0')
+        self.assertTrue(pd.isna(records['sku'][1]))
+        self.assertEqual(records['precio'].tolist(), [1000, 0])
+        self.assertEqual(records['stock'].tolist(), [3, 1])
+
+if __name__ == '__main__':
+    unittest.main()